@@ -1,31 +1,464 @@
 from flask import Flask, render_template, request, jsonify, Response
+from flask.json.provider import DefaultJSONProvider
+import orjson
 import cv2
-import json
 import os
 from datetime import datetime
 import base64
-import numpy as np
-from deepface import DeepFace
 import io
+import shutil
+import sqlite3
+from contextlib import closing, contextmanager
+import numpy as np
 from PIL import Image
+# Silence TensorFlow's C++ start-up logging; only honoured if set before TensorFlow is imported
+os.environ.setdefault("TF_CPP_MIN_LOG_LEVEL", "3")
+# DeepFace sets this before its own TensorFlow import; importing TensorFlow first must not switch it to Keras 3
+os.environ.setdefault("TF_USE_LEGACY_KERAS", "1")
+import tensorflow as tf
+from deepface import DeepFace
+from deepface.modules import modeling
+from embedder import Embedder
 import threading
 import time
+from collections import OrderedDict
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # Windows: no gunicorn there, so the dev server's threads are the only writers
+
+class ORJSONProvider(DefaultJSONProvider):
+    """Flask JSON provider backed by orjson, which also serializes NumPy values natively"""
+    option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+
+    @property
+    def dump_option(self):
+        # Keep Flask's sort_keys default, which clients may already rely on for key order
+        return self.option | orjson.OPT_SORT_KEYS if self.sort_keys else self.option
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default, option=self.dump_option).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand orjson's bytes straight to the response instead of round-tripping through str
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, default=self.default, option=self.dump_option), mimetype=self.mimetype
+        )
 
 app = Flask(__name__)
+app.json = ORJSONProvider(app)
 
 # Configuration
 DB_PATH = "face_db"  # Directory to store employee face images
-ATTENDANCE_FILE = "attendance.json"
+ATTENDANCE_DB = "attendance.db"  # SQLite database of attendance events
+ATTENDANCE_FILE = "attendance.json"  # Legacy attendance store, imported into ATTENDANCE_DB once
+LEGACY_IMPORT_TIMEOUT_MS = 300000  # How long a booting worker waits for another worker's legacy import
 EMPLOYEES_FILE = "employees.json"
+EMBEDDINGS_FILE = "embeddings.npz"  # Cached GhostFaceNet embeddings of enrolled employees
+ROSTER_LOCK_FILE = "employees.lock"  # flock()ed by whichever worker process is changing the two files above
+MODEL_NAME = "GhostFaceNet"
+DETECTOR_BACKEND = "opencv"
+SPOOFING_MODEL = "Fasnet"
+TF_INTRA_OP_THREADS = int(os.environ.get("TF_INTRA_OP_THREADS", "0"))  # 0 lets TensorFlow use every core
+EMBEDDING_DIM = 512  # GhostFaceNet output size
+RECOGNITION_THRESHOLD = 0.65  # Max cosine distance accepted as a match
+ATTENDANCE_PAGE_MAX = 1000  # Max events per /get_attendance page
+DETECT_MAX_SIDE = 640  # Frames are downscaled to this long side before face detection
+EMBED_CROP_MARGIN = 0.5  # Context kept around a detected face, as a fraction of its size, when cropping for embedding
+DETECT_CACHE_CLIENTS = 256  # Clients whose last /detect result is remembered
+DETECT_CACHE_MAX_DISTANCE = 4  # Max differing face-crop hash bits still treated as the same face
+DETECT_CACHE_TTL = 0.5  # Seconds a /detect result is reused, i.e. only for the next few frames
+# Reuse a client's passing liveness verdict on the next few near-identical frames. Off by default: the crop
+# hash cannot tell a live face from a photo of it, and clients behind one reverse proxy share an address
+FRAME_SKIP_SPOOF = os.environ.get("FRAME_SKIP_SPOOF", "false").lower() in ("1", "true", "yes")
+LIVENESS_CACHE_CLIENTS = 256  # Clients whose last liveness verdict is remembered
+LIVENESS_MAX_DISTANCE = 5  # Max differing face-crop hash bits still treated as the same face
+LIVENESS_TTL = 1.5  # Seconds a passing verdict is reused, i.e. only for consecutive frames
+RECOGNITION_CONCURRENCY = int(os.environ.get("RECOG_CONCURRENCY", "2"))  # Max recognitions running at once per process
+RECOGNITION_ADMISSION_TIMEOUT = 0.05  # Seconds to wait for a free recognition slot before answering 429
+SERVER_CAMERA = os.environ.get("SERVER_CAMERA")  # Device index or stream URL for /video_feed; unset = browser camera only
+MJPEG_QUALITY = 75  # JPEG quality of /video_feed frames
+CAMERA_MAX_FAILURES = 40  # Consecutive failed reads (about 2 s) before the server camera is reopened
+CAMERA_REOPEN_MAX_DELAY = 30  # Longest wait, in seconds, between attempts to reopen a lost camera
+
+JPEG_MAGIC = b'\xff\xd8\xff'
+MJPEG_PART_HEADER = b'--frame\r\nContent-Type: image/jpeg\r\n\r\n'
+MJPEG_PART_FOOTER = b'\r\n'
+# Pillow modes whose 8-bit pixels cvtColor turns into BGR directly
+PIL_TO_BGR = {'L': cv2.COLOR_GRAY2BGR, 'RGB': cv2.COLOR_RGB2BGR, 'RGBA': cv2.COLOR_RGBA2BGR}
+# Spaces and characters that are unsafe in file names all become '_' in one pass
+SAFE_NAME_TABLE = str.maketrans({c: '_' for c in ' <>:"/\\|?*'})
 
 # Global variables
 camera = None
-is_processing = False
+recognize_sema = threading.BoundedSemaphore(RECOGNITION_CONCURRENCY)
+
+def b64_from_dataurl(data_url):
+    """Decode the base64 payload of a data URL (or a bare base64 string)"""
+    # b64decode would encode a str to ASCII anyway; a memoryview then skips the header without copying the payload
+    data = data_url.encode('ascii') if isinstance(data_url, str) else data_url
+    comma = data.find(b',')
+    return base64.b64decode(memoryview(data)[comma + 1:], validate=False)
+
+def decode_image(image_data):
+    """Decode a base64 data URL or raw encoded image bytes straight into an OpenCV BGR array"""
+    if isinstance(image_data, np.ndarray):
+        return image_data
+    image_bytes = image_data if isinstance(image_data, bytes) else b64_from_dataurl(image_data)
+    image = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    if image is None:
+        # Formats OpenCV cannot read (GIF, some WebP/TIFF variants) fall back to Pillow
+        try:
+            with Image.open(io.BytesIO(image_bytes)) as im:
+                im.load()
+                image = pil_to_np(im)
+        except (OSError, ValueError, Image.DecompressionBombError):
+            raise ValueError("Could not decode image data")
+    return image
+
+def encode_jpeg(frame, quality=MJPEG_QUALITY):
+    """Encode a BGR frame as JPEG bytes"""
+    ok, buf = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, quality])
+    return buf.tobytes() if ok else None
+
+def pil_to_np(im):
+    """Convert a loaded PIL image to an OpenCV BGR array: one copy out of Pillow, one by cvtColor"""
+    if im.mode not in PIL_TO_BGR:
+        im = im.convert('RGB')
+    # Grayscale and RGBA go straight to cvtColor instead of through an extra convert('RGB') copy
+    pixels = np.asarray(im).reshape(im.size[1], im.size[0], len(im.getbands()))
+    return cv2.cvtColor(pixels, PIL_TO_BGR[im.mode])
+
+def _resize_for_detect(img, max_side=DETECT_MAX_SIDE):
+    """Downscale so the long side is at most max_side; return the image and the scale applied"""
+    h, w = img.shape[:2]
+    s = max_side / max(h, w)
+    if s >= 1:
+        return img, 1.0
+    return cv2.resize(img, (int(w * s), int(h * s)), interpolation=cv2.INTER_AREA), s
+
+def detect_faces(image, anti_spoofing=True):
+    """Run DeepFace.extract_faces on a downscaled copy and map facial areas back to original pixels"""
+    small, scale = _resize_for_detect(image)
+    faces = DeepFace.extract_faces(
+        img_path=small,
+        detector_backend=DETECTOR_BACKEND,
+        enforce_detection=False,
+        anti_spoofing=anti_spoofing
+    )
+    if scale != 1.0:
+        for face in faces:
+            area = face['facial_area']
+            for key in ('x', 'y', 'w', 'h'):
+                area[key] = int(round(area[key] / scale))
+            for key in ('left_eye', 'right_eye'):
+                if area.get(key) is not None:
+                    area[key] = tuple(int(round(v / scale)) for v in area[key])
+    return faces
+
+def face_crop(image, faces, margin=EMBED_CROP_MARGIN):
+    """Crop the first detected face, plus some context, from the full-resolution image"""
+    if not faces:
+        return image
+    area = faces[0]['facial_area']
+    pad_x, pad_y = int(area['w'] * margin), int(area['h'] * margin)
+    h, w = image.shape[:2]
+    x0, y0 = max(area['x'] - pad_x, 0), max(area['y'] - pad_y, 0)
+    x1, y1 = min(area['x'] + area['w'] + pad_x, w), min(area['y'] + area['h'] + pad_y, h)
+    if x1 <= x0 or y1 <= y0:
+        return image
+    return image[y0:y1, x0:x1]
+
+def check_liveness(image, faces, client=None):
+    """Return True if any detected face passes antispoofing, reusing a client's fresh pass for an unchanged face"""
+    face_hash = None
+    if FRAME_SKIP_SPOOF and client:
+        face_hash = DetectionCache.frame_hash(face_crop(image, faces, margin=0))
+        if liveness_cache.get(client, face_hash):
+            return True
+    is_real = False
+    for face in faces:
+        area = face['facial_area']
+        if spoof_model.analyze(img=image, facial_area=(area['x'], area['y'], area['w'], area['h']))[0]:
+            is_real = True
+            break
+    if face_hash is not None and is_real:
+        # Only passes are reused; a rejected face is checked again on the next frame
+        liveness_cache.put(client, face_hash)
+    return is_real
+
+def safe_name(name):
+    """File-system safe form of an employee name, used for their face_db folder and photo"""
+    return name.translate(SAFE_NAME_TABLE).strip('.') or '_'
+
+def request_image():
+    """Return the posted frame: raw bytes of a multipart 'image' file, else the JSON 'image' data URL"""
+    file = request.files.get('image')
+    if file:
+        return file.read()
+    data = request.get_json(silent=True) or {}
+    return data.get('image')
+
+class Camera:
+    """Server-side capture device whose latest frame is shared by every /video_feed client.
+
+    The reader thread grab()s every frame so the driver never queues stale ones,
+    but only pays for retrieve() (decode and colour conversion) while someone is
+    waiting for a frame.
+    """
+
+    def __init__(self, source):
+        self.source = int(source) if str(source).isdigit() else source
+        self.capture = None
+        self.thread = None
+        self.frame = None
+        self.frame_id = 0
+        self.waiting = 0
+        self.lock = threading.Lock()
+        self.new_frame = threading.Condition(self.lock)
+        self.part = None
+        self.part_id = 0
+        self.encode_lock = threading.Lock()
+
+    def start(self):
+        """Open the device and start the reader thread on first use"""
+        with self.lock:
+            # The reader never exits; it reopens the source itself when it stops delivering
+            if self.thread is not None:
+                return
+            capture = self._open()
+            if not capture.isOpened():
+                capture.release()
+                raise RuntimeError(f"Could not open camera {self.source}")
+            self.capture = capture
+            self.thread = threading.Thread(target=self._reader, daemon=True)
+            self.thread.start()
+
+    def _open(self):
+        """Create a VideoCapture for the source; check isOpened() on the result"""
+        capture = cv2.VideoCapture(self.source)
+        # Keep the driver queue one frame deep so a grab() is always the newest frame
+        capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return capture
+
+    def _reader(self):
+        failures = 0
+        while True:
+            try:
+                if self._read():
+                    failures = 0
+                    continue
+                failures += 1
+                if failures >= CAMERA_MAX_FAILURES:
+                    # RTSP drop, unplugged USB device or end of a file: retrying the same capture never recovers
+                    self._reopen()
+                    failures = 0
+                else:
+                    time.sleep(0.05)
+            except Exception:
+                # A driver error must not silently end the only thread feeding /video_feed
+                app.logger.exception("Camera %s read failed", self.source)
+                failures += 1
+                time.sleep(0.05)
+
+    def _read(self):
+        """grab() the newest frame and publish it if someone is waiting; False if the source gave nothing"""
+        if not self.capture.grab():
+            return False
+        with self.lock:
+            wanted = self.waiting > 0
+        if not wanted:
+            return True
+        ok, frame = self.capture.retrieve()
+        if not ok:
+            return False
+        with self.new_frame:
+            self.frame = frame
+            self.frame_id += 1
+            self.new_frame.notify_all()
+        return True
+
+    def _reopen(self):
+        """Release the capture and open the source again, backing off until it comes back"""
+        app.logger.warning("Camera %s stopped delivering frames, reopening it", self.source)
+        with self.new_frame:
+            # Don't keep serving the last frame as if it were live
+            self.frame = None
+        delay = 0.5
+        while True:
+            self.capture.release()
+            time.sleep(delay)
+            self.capture = self._open()
+            if self.capture.isOpened():
+                app.logger.info("Camera %s reopened", self.source)
+                return
+            delay = min(delay * 2, CAMERA_REOPEN_MAX_DELAY)
+
+    def _wait(self, last_id, timeout=1.0):
+        """Block until a frame newer than last_id is published (or timeout); return (frame_id, frame)"""
+        with self.new_frame:
+            self.waiting += 1
+            try:
+                self.new_frame.wait_for(lambda: self.frame_id != last_id, timeout=timeout)
+            finally:
+                self.waiting -= 1
+            return self.frame_id, self.frame
+
+    def latest(self):
+        """Return a freshly captured frame, the previous one if none arrives in time, or None while the source is lost"""
+        self.start()
+        with self.lock:
+            last_id = self.frame_id
+        return self._wait(last_id)[1]
+
+    def _part(self, frame_id, frame):
+        """Build each frame's multipart chunk once, however many clients are streaming it"""
+        with self.encode_lock:
+            # A client that fell behind just gets the newer frame's chunk
+            if frame_id > self.part_id:
+                jpeg = encode_jpeg(frame)
+                self.part = None if jpeg is None else b''.join((MJPEG_PART_HEADER, jpeg, MJPEG_PART_FOOTER))
+                self.part_id = frame_id
+            return self.part
+
+    def mjpeg(self):
+        """Yield each new frame as one part of a multipart/x-mixed-replace stream"""
+        self.start()
+        last_id = 0
+        while True:
+            frame_id, frame = self._wait(last_id)
+            if frame_id == last_id or frame is None:
+                continue
+            last_id = frame_id
+            part = self._part(last_id, frame)
+            if part is not None:
+                yield part
+
+class LivenessCache:
+    """Last passing antispoofing verdict per client, keyed by a perceptual hash of the face crop.
+
+    Consecutive frames of someone standing still hash almost identically, so
+    Fasnet can skip a frame that follows a pass within ttl seconds. Verdicts
+    are never extended, so a photo held up later is always checked afresh.
+    """
+
+    def __init__(self, max_clients=LIVENESS_CACHE_CLIENTS, max_distance=LIVENESS_MAX_DISTANCE, ttl=LIVENESS_TTL):
+        self.max_clients = max_clients
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, client, face_hash):
+        """Return True if the client passed within ttl seconds with a face hash within max_distance bits"""
+        with self._lock:
+            entry = self._entries.get(client)
+            if entry is None:
+                return False
+            last_hash, checked_at = entry
+            if time.monotonic() - checked_at > self.ttl:
+                del self._entries[client]
+                return False
+            return bin(last_hash ^ face_hash).count("1") <= self.max_distance
+
+    def put(self, client, face_hash):
+        """Remember a pass, evicting the least recently checked client when full"""
+        with self._lock:
+            self._entries[client] = (face_hash, time.monotonic())
+            self._entries.move_to_end(client)
+            while len(self._entries) > self.max_clients:
+                self._entries.popitem(last=False)
+
+class DetectionCache:
+    """Each client's last /detect result, keyed by perceptual hashes of its face crops.
+
+    Webcam frames sent 100 ms apart are usually near-identical, so a frame that
+    arrives within ttl seconds and whose face regions still hash within a few
+    bits of the last detected ones reuses those boxes and liveness verdicts
+    instead of running DeepFace again.
+    """
+
+    def __init__(self, max_clients=DETECT_CACHE_CLIENTS, max_distance=DETECT_CACHE_MAX_DISTANCE,
+                 ttl=DETECT_CACHE_TTL):
+        self.max_clients = max_clients
+        self.max_distance = max_distance
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def frame_hash(image):
+        """64-bit average hash: 8x8 grayscale thumbnail thresholded at its mean"""
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        thumb = cv2.resize(gray, (8, 8), interpolation=cv2.INTER_AREA)
+        bits = np.packbits(thumb > thumb.mean())
+        return int.from_bytes(bits.tobytes(), "big")
+
+    @staticmethod
+    def region_hashes(image, faces):
+        """Hash of each /detect face box in image, or of the whole frame when there are none"""
+        hashes = []
+        for face in faces:
+            x, y = max(face['x'], 0), max(face['y'], 0)
+            crop = image[y:y + face['h'], x:x + face['w']]
+            hashes.append(DetectionCache.frame_hash(crop if crop.size else image))
+        return hashes or [DetectionCache.frame_hash(image)]
+
+    def get(self, client, image):
+        """Return the client's last faces if they are fresh and their crops in image are unchanged, else None"""
+        with self._lock:
+            entry = self._entries.get(client)
+            if entry is not None and time.monotonic() - entry[2] > self.ttl:
+                del self._entries[client]
+                entry = None
+        if entry is not None:
+            last_hashes, faces, _ = entry
+            hashes = self.region_hashes(image, faces)
+            if all(bin(a ^ b).count("1") <= self.max_distance for a, b in zip(hashes, last_hashes)):
+                with self._lock:
+                    self.hits += 1
+                return faces
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, client, image, faces):
+        """Remember a client's result, evicting the least recently detected client when full"""
+        entry = (self.region_hashes(image, faces), faces, time.monotonic())
+        with self._lock:
+            self._entries[client] = entry
+            self._entries.move_to_end(client)
+            while len(self._entries) > self.max_clients:
+                self._entries.popitem(last=False)
+
+    def cache_stats(self):
+        """Hit/miss counters for telemetry"""
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "hit_rate": self.hits / total if total else 0.0
+            }
 
 class AttendanceSystem:
     def __init__(self):
+        self.emb_lock = threading.Lock()
+        self.refresh_lock = threading.Lock()
+        self._db_local = threading.local()
         self.ensure_directories()
-        self.load_data()
+        self.init_db()
+        with self.roster_lock():
+            self.load_data()
+            self.load_embeddings()
     
     def ensure_directories(self):
         """Create necessary directories if they don't exist"""
@@ -38,53 +471,258 @@ class AttendanceSystem:
         """Load existing data or create empty structures"""
         # Load employees
         if os.path.exists(EMPLOYEES_FILE):
-            with open(EMPLOYEES_FILE, 'r') as f:
-                self.employees = json.load(f)
+            with open(EMPLOYEES_FILE, 'rb') as f:
+                self.employees = orjson.loads(f.read())
         else:
             self.employees = {}
             self.save_employees()
-        
-        # Load attendance
-        if os.path.exists(ATTENDANCE_FILE):
-            with open(ATTENDANCE_FILE, 'r') as f:
-                self.attendance = json.load(f)
-        else:
-            self.attendance = []
-            self.save_attendance()
+        # Normalized name -> stored name, for O(1) duplicate checks
+        self.name_index = {name.strip().lower(): name for name in self.employees}
+        self.employees_version = self._employees_version()
     
     def save_employees(self):
         """Save employees data to JSON"""
-        with open(EMPLOYEES_FILE, 'w') as f:
-            json.dump(self.employees, f, indent=2)
+        # Write-then-rename so other worker processes never read a half-written file
+        tmp_path = f"{EMPLOYEES_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(orjson.dumps(self.employees, option=orjson.OPT_INDENT_2))
+        os.replace(tmp_path, EMPLOYEES_FILE)
+        self.employees_version = self._employees_version()
+    
+    def _employees_version(self):
+        """(inode, mtime, size) of the employees file, or None if it is missing"""
+        # Every save is an os.replace onto a fresh inode, so two saves within one coarse mtime tick still differ
+        try:
+            st = os.stat(EMPLOYEES_FILE)
+        except OSError:
+            return None
+        return st.st_ino, st.st_mtime_ns, st.st_size
+    
+    def refresh_if_changed(self):
+        """Reload employees and embeddings if another worker process changed them on disk"""
+        if self._employees_version() == self.employees_version:
+            return
+        with self.roster_lock():
+            if self._employees_version() != self.employees_version:
+                self.load_data()
+                self.load_embeddings()
     
-    def save_attendance(self):
-        """Save attendance data to JSON"""
-        with open(ATTENDANCE_FILE, 'w') as f:
-            json.dump(self.attendance, f, indent=2)
+    @contextmanager
+    def roster_lock(self):
+        """Serialize changes to employees.json and embeddings.npz across threads and worker processes"""
+        with self.refresh_lock, open(ROSTER_LOCK_FILE, 'ab') as lock_file:
+            if fcntl is not None:
+                # Released when the file is closed
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            yield
+    
+    def _connect(self):
+        """Open a SQLite connection tuned for many small writes alongside readers"""
+        conn = sqlite3.connect(ATTENDANCE_DB)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        return conn
+    
+    def get_db(self):
+        """Return this thread's attendance database connection"""
+        conn = getattr(self._db_local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._db_local.conn = conn
+        return conn
+    
+    def init_db(self):
+        """Create the attendance schema and import a legacy attendance.json if present"""
+        with closing(self._connect()) as conn:
+            conn.executescript("""
+                CREATE TABLE IF NOT EXISTS events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    employee TEXT NOT NULL,
+                    date TEXT NOT NULL,
+                    type TEXT NOT NULL,
+                    time TEXT NOT NULL,
+                    timestamp TEXT NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_events_employee_date ON events (employee, date);
+                CREATE INDEX IF NOT EXISTS idx_events_date ON events (date);
+            """)
+            if os.path.exists(ATTENDANCE_FILE):
+                # Every worker runs this at boot: wait out another worker's import rather than failing,
+                # and re-check under the write lock so exactly one of them imports the file
+                conn.execute(f"PRAGMA busy_timeout = {LEGACY_IMPORT_TIMEOUT_MS}")
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    if os.path.exists(ATTENDANCE_FILE):
+                        self._import_legacy_attendance(conn)
+                    conn.commit()
+                except Exception:
+                    conn.rollback()
+                    raise
+    
+    def _import_legacy_attendance(self, conn):
+        """Insert attendance.json's events and rename it, inside the caller's write transaction"""
+        with open(ATTENDANCE_FILE, 'rb') as f:
+            legacy = orjson.loads(f.read())
+        rows = []
+        for record in legacy:
+            events = record.get('events')
+            if events is None and record.get('time'):
+                # Oldest format: a single check-in per record
+                events = [{"type": "in", "time": record['time']}]
+            for event in events or []:
+                rows.append((
+                    record['employee'],
+                    record['date'],
+                    event['type'],
+                    event['time'],
+                    event.get('timestamp') or f"{record['date']}T{event['time']}"
+                ))
+        conn.executemany(
+            "INSERT INTO events (employee, date, type, time, timestamp) VALUES (?, ?, ?, ?, ?)",
+            rows
+        )
+        # Renamed before the commit, so no later transaction can see the file and import it again
+        os.replace(ATTENDANCE_FILE, ATTENDANCE_FILE + ".imported")
+    
+    def get_attendance_records(self, date=None):
+        """Return attendance grouped per employee and day as {employee, date, events}, optionally for one date"""
+        if date:
+            rows = self.get_db().execute(
+                "SELECT employee, date, type, time, timestamp FROM events WHERE date = ? ORDER BY id", (date,)
+            ).fetchall()
+        else:
+            rows = self.get_db().execute(
+                "SELECT employee, date, type, time, timestamp FROM events ORDER BY id"
+            ).fetchall()
+        return self._group_events(rows)
+    
+    def get_attendance_page(self, limit, before=None):
+        """Return up to limit events older than event id before, newest first, and the cursor for the next page
+
+        Keyset paging on the primary key: each page is a rowid range scan, however deep it is.
+        """
+        if before is None:
+            rows = self.get_db().execute(
+                "SELECT id, employee, date, type, time, timestamp FROM events ORDER BY id DESC LIMIT ?", (limit,)
+            ).fetchall()
+        else:
+            rows = self.get_db().execute(
+                "SELECT id, employee, date, type, time, timestamp FROM events WHERE id < ? ORDER BY id DESC LIMIT ?",
+                (before, limit)
+            ).fetchall()
+        next_before = rows[-1]['id'] if len(rows) == limit else None
+        return self._group_events(rows), next_before
+    
+    @staticmethod
+    def _group_events(rows):
+        """Group event rows, in the order given, into {employee, date, events} records"""
+        records = {}
+        for row in rows:
+            key = (row['employee'], row['date'])
+            record = records.get(key)
+            if record is None:
+                record = records[key] = {"employee": row['employee'], "date": row['date'], "events": []}
+            record['events'].append({"type": row['type'], "time": row['time'], "timestamp": row['timestamp']})
+        return list(records.values())
+    
+    def compute_embedding(self, image, faces=None):
+        """Return the L2-normalized embedding of the first face in a BGR image, or None
+
+        faces are detect_faces() results for image, reused to skip a second full-frame detection.
+        """
+        if faces is None:
+            faces = detect_faces(image, anti_spoofing=False)
+        if faces and max(image.shape[:2]) <= DETECT_MAX_SIDE:
+            # Detection ran at full resolution, so its aligned crop is embedded as is
+            representations = embedder.embed_faces(faces[:1])
+        else:
+            representations = embedder.represent(face_crop(image, faces))
+        if not representations:
+            return None
+        embedding = np.asarray(representations[0], dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        if norm == 0:
+            return None
+        return embedding / norm
+    
+    def load_embeddings(self):
+        """Load cached employee embeddings, computing any that are missing from disk"""
+        cached_names, cached_matrix = [], None
+        if os.path.exists(EMBEDDINGS_FILE):
+            with np.load(EMBEDDINGS_FILE) as data:
+                cached_names = data['names'].tolist()
+                cached_matrix = data['embeddings'].astype(np.float32, copy=False)
+        
+        if cached_names and cached_names == list(self.employees):
+            # Cache already matches the roster: use the stored (N, 512) matrix as is
+            with self.emb_lock:
+                self.emb_names = cached_names
+                self.emb_matrix = cached_matrix
+            return
+        
+        cached = dict(zip(cached_names, cached_matrix)) if cached_names else {}
+        names, rows = [], []
+        for name, info in self.employees.items():
+            embedding = cached.get(name)
+            if embedding is None:
+                image = cv2.imread(info['image_path'])
+                if image is None:
+                    app.logger.warning("Missing face image for %s: %s", name, info['image_path'])
+                    continue
+                try:
+                    embedding = self.compute_embedding(image)
+                except Exception as e:
+                    app.logger.warning("Could not embed face image for %s: %s", name, e)
+                    continue
+                if embedding is None:
+                    continue
+            names.append(name)
+            rows.append(embedding)
+        
+        with self.emb_lock:
+            self.emb_names = names
+            self.emb_matrix = np.vstack(rows).astype(np.float32) if rows else np.empty((0, EMBEDDING_DIM), dtype=np.float32)
+        if names != cached_names:
+            self.save_embeddings()
+    
+    def save_embeddings(self):
+        """Save the embedding matrix and its row names to disk"""
+        tmp_path = f"{EMBEDDINGS_FILE}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            np.savez(f, names=np.array(self.emb_names, dtype=str), embeddings=self.emb_matrix)
+        os.replace(tmp_path, EMBEDDINGS_FILE)
+    
+    def add_embedding(self, name, embedding):
+        """Append an employee's embedding to the in-memory matrix and persist it"""
+        with self.emb_lock:
+            self.emb_matrix = np.vstack([self.emb_matrix, embedding[None, :]])
+            self.emb_names = self.emb_names + [name]
+            self.save_embeddings()
+    
+    def remove_embedding(self, name):
+        """Drop an employee's embedding row and persist the matrix"""
+        with self.emb_lock:
+            if name not in self.emb_names:
+                return
+            index = self.emb_names.index(name)
+            self.emb_matrix = np.delete(self.emb_matrix, index, axis=0)
+            self.emb_names = self.emb_names[:index] + self.emb_names[index + 1:]
+            self.save_embeddings()
     
     def add_employee(self, name, image_data):
         """Add a new employee to the database with antispoofing verification"""
         try:
-            # Decode base64 image first
-            image_bytes = base64.b64decode(image_data.split(',')[1])
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Save temporary image for antispoofing check
-            temp_path = "temp_employee.jpg"
-            image.save(temp_path)
+            # Decode the image first
+            image_bytes = image_data if isinstance(image_data, bytes) else b64_from_dataurl(image_data)
+            image = decode_image(image_bytes)
             
             # Step 1: Antispoofing verification
             try:
-                spoofing_result = DeepFace.extract_faces(
-                    img_path=temp_path,
-                    detector_backend="opencv",
-                    enforce_detection=False,
-                    anti_spoofing=True
-                )
+                spoofing_result = detect_faces(image)
                 
                 if len(spoofing_result) == 0:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
                     return False, "No face detected in the image"
                 
                 # Check if face is real
@@ -98,200 +736,189 @@ class AttendanceSystem:
                         break
                 
                 if not real_face_detected:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
                     return False, "Spoofing detected! Please use a real photo, not a screen capture or printed photo"
                 
             except Exception as spoof_error:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
                 return False, f"Error during antispoofing verification: {str(spoof_error)}"
             
-            # Step 2: If antispoofing passed, proceed with adding employee
-            # Create employee directory
-            employee_dir = os.path.join(DB_PATH, name.replace(" ", "_"))
-            if not os.path.exists(employee_dir):
-                os.makedirs(employee_dir)
-            
-            # Save the image to final location
-            image_path = os.path.join(employee_dir, f"{name.replace(' ', '_')}.jpg")
-            image.save(image_path)
-            
-            # Clean up temp file
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            embedding = self.compute_embedding(image, spoofing_result)
+            if embedding is None:
+                return False, "Could not extract face features from the image"
             
-            # Add to employees database
-            self.employees[name] = {
-                "id": len(self.employees) + 1,
-                "name": name,
-                "image_path": image_path,
-                "created_at": datetime.now().isoformat()
-            }
-            
-            self.save_employees()
+            # Step 2: If antispoofing passed, proceed with adding employee
+            with self.roster_lock():
+                # Start from what is on disk now, so another worker's enrolment is not overwritten
+                self.load_data()
+                self.load_embeddings()
+                if name.strip().lower() in self.name_index:
+                    return False, "Employee with this name already exists."
+                
+                employee_id = max((info.get('id', 0) for info in self.employees.values()), default=0) + 1
+                # Create employee directory
+                # The id keeps names that only differ in unsafe characters ("Bob?", "Bob/") out of each other's folder
+                employee_dir = os.path.join(DB_PATH, f"{safe_name(name)}_{employee_id}")
+                if not os.path.exists(employee_dir):
+                    os.makedirs(employee_dir)
+                
+                # Save the image to final location
+                image_path = os.path.join(employee_dir, f"{safe_name(name)}.jpg")
+                if image_bytes.startswith(JPEG_MAGIC):
+                    # Already a JPEG: keep the uploaded bytes rather than re-encoding the pixels
+                    with open(image_path, 'wb') as f:
+                        f.write(image_bytes)
+                else:
+                    cv2.imwrite(image_path, image, [cv2.IMWRITE_JPEG_QUALITY, 92])
+                
+                # Add to employees database
+                self.employees[name] = {
+                    "id": employee_id,
+                    "name": name,
+                    "image_path": image_path,
+                    "created_at": datetime.now().isoformat()
+                }
+                
+                self.name_index[name.strip().lower()] = name
+                # Embeddings first: other workers reload when employees.json changes
+                self.add_embedding(name, embedding)
+                self.save_employees()
             return True, "Employee added successfully with antispoofing verification"
         
         except Exception as e:
-            # Clean up temp file if it exists
-            if os.path.exists("temp_employee.jpg"):
-                os.remove("temp_employee.jpg")
             return False, f"Error adding employee: {str(e)}"
     
-    def recognize_face(self, image_data):
-        """Recognize face from camera image with antispoofing"""
-        global is_processing
-        
-        if is_processing:
-            return None, "Processing previous request", False
-        
-        is_processing = True
-        
+    def remove_employee(self, name):
+        """Remove an employee, their face folder and their embedding"""
+        with self.roster_lock():
+            # Start from what is on disk now, so another worker's enrolment is not overwritten
+            self.load_data()
+            self.load_embeddings()
+            if name not in self.employees:
+                return False, "Employee not found"
+            # Remove image directory
+            # The stored photo path also covers folders named before safe_name() existed
+            emp_dir = os.path.dirname(self.employees[name]['image_path'])
+            if os.path.dirname(os.path.abspath(emp_dir)) == os.path.abspath(DB_PATH) and os.path.exists(emp_dir):
+                shutil.rmtree(emp_dir)
+            del self.employees[name]
+            self.name_index.pop(name.strip().lower(), None)
+            # Embeddings first: other workers reload when employees.json changes
+            self.remove_embedding(name)
+            self.save_employees()
+        return True, f"Removed employee {name}"
+    
+    def recognize_face(self, image_data, client=None):
+        """Recognize face from camera image with antispoofing; client keys the liveness verdict cache"""
         try:
-            # Decode base64 image
-            image_bytes = base64.b64decode(image_data.split(',')[1])
-            image = Image.open(io.BytesIO(image_bytes))
-            
-            # Save temporary image
-            temp_path = "temp_frame.jpg"
-            image.save(temp_path)
+            # Decode the image
+            image = decode_image(image_data)
             
             # Step 1: Antispoofing check
+            spoofing_result = None
             try:
-                spoofing_result = DeepFace.extract_faces(
-                    img_path=temp_path,
-                    detector_backend="opencv",
-                    enforce_detection=False,
-                    anti_spoofing=True
-                )
+                spoofing_result = detect_faces(image, anti_spoofing=False)
                 
                 if len(spoofing_result) == 0:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
                     return None, "No face detected", False
                 
                 # Check if any face passes antispoofing
-                real_face_detected = False
-                for face_result in spoofing_result:
-                    if hasattr(face_result, 'is_real') and face_result.is_real:
-                        real_face_detected = True
-                        break
-                    elif isinstance(face_result, dict) and face_result.get('is_real', False):
-                        real_face_detected = True
-                        break
-                
-                if not real_face_detected:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
+                if not check_liveness(image, spoofing_result, client):
                     return None, "Spoofing detected! Please use a real face, not a photo or video", False
                 
             except Exception as spoof_error:
                 # If antispoofing fails, we'll continue with a warning but still try recognition
-                print(f"Antispoofing check failed: {spoof_error}")
+                app.logger.warning("Antispoofing check failed: %s", spoof_error)
                 # We'll proceed but mark it as potentially unsafe
             
             # Step 2: Face recognition (only if antispoofing passed)
-            if os.path.exists(DB_PATH) and os.listdir(DB_PATH):
+            with self.emb_lock:
+                emb_names, emb_matrix = self.emb_names, self.emb_matrix
+            if emb_names:
                 try:
-                    dfs = DeepFace.find(
-                        img_path=temp_path,
-                        db_path=DB_PATH,
-                        model_name="GhostFaceNet",
-                        detector_backend="opencv",
-                        enforce_detection=False,
-                        silent=True
-                    )
-                    
-                    # Clean up temp file
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
-                    
-                    if len(dfs) > 0 and len(dfs[0]) > 0:
-                        # Found a match
-                        identity_path = dfs[0].iloc[0]['identity']
-                        distance = dfs[0].iloc[0]['distance']
-                        
-                        # Extract employee name from path
-                        employee_name = None
-                        for name, info in self.employees.items():
-                            if info['image_path'] in identity_path:
-                                employee_name = name
-                                break
+                    probe = self.compute_embedding(image, spoofing_result)
+                    if probe is not None:
+                        # Rows and probe are unit vectors, so one matmul gives every cosine similarity
+                        scores = emb_matrix @ probe
+                        best = int(np.argmax(scores))
+                        distance = 1.0 - float(scores[best])
                         
-                        if employee_name and distance < 0.65:  # Threshold for recognition
-                            return employee_name, f"Recognized with confidence: {1-distance:.2f}", True
+                        if distance < RECOGNITION_THRESHOLD:
+                            return emb_names[best], f"Recognized with confidence: {1-distance:.2f}", True
                     
                     return None, "Face not recognized", True
                 
                 except Exception as e:
-                    if os.path.exists(temp_path):
-                        os.remove(temp_path)
                     return None, f"Recognition error: {str(e)}", True
             else:
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
                 return None, "No employees in database", True
         
         except Exception as e:
             return None, f"Processing error: {str(e)}", False
-        
-        finally:
-            is_processing = False
     
     def mark_attendance(self, employee_name):
         """Mark attendance for an employee with multiple in/out events per day and a 2-minute cooldown between events for the same person"""
         try:
-            today = datetime.now().strftime("%Y-%m-%d")
-            now_time = datetime.now().strftime("%H:%M:%S")
-            now_iso = datetime.now().isoformat()
+            # One clock read so date, time and timestamp always describe the same instant
             now_dt = datetime.now()
-            # Find today's record for this employee
-            today_record = None
-            for record in self.attendance:
-                if record.get('employee') == employee_name and record.get('date') == today:
-                    today_record = record
-                    break
-            if today_record is None:
-                # No record for today, create new with first event as 'in'
-                new_record = {
-                    "employee": employee_name,
-                    "date": today,
-                    "events": [
-                        {"type": "in", "time": now_time, "timestamp": now_iso}
-                    ]
-                }
-                self.attendance.append(new_record)
-                self.save_attendance()
-                return True, f"Clocked IN for {employee_name} at {now_time}"
-            else:
-                # There is a record for today, check last event
-                events = today_record.get('events', [])
-                if not events:
+            today = now_dt.strftime("%Y-%m-%d")
+            now_time = now_dt.strftime("%H:%M:%S")
+            now_iso = now_dt.isoformat()
+            conn = self.get_db()
+            # Take the write lock up front so concurrent marks for one person cannot interleave
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                # Find today's last event for this employee
+                last_event = conn.execute(
+                    "SELECT type, timestamp FROM events WHERE employee = ? AND date = ? ORDER BY id DESC LIMIT 1",
+                    (employee_name, today)
+                ).fetchone()
+                if last_event is None:
+                    # No event today, first event is 'in'
                     next_type = 'in'
                 else:
-                    last_event = events[-1]
-                    last_type = last_event['type']
-                    last_ts = last_event.get('timestamp')
                     # Cooldown check
-                    if last_ts:
-                        try:
-                            last_dt = datetime.fromisoformat(last_ts)
-                            diff = (now_dt - last_dt).total_seconds()
-                            if diff < 120:
-                                wait_sec = int(120 - diff)
-                                return False, f"Please wait {wait_sec} seconds before next attendance event. Cooldown is 2 minutes between IN/OUT for the same person."
-                        except Exception:
-                            pass
-                    next_type = 'out' if last_type == 'in' else 'in'
-                events.append({"type": next_type, "time": now_time, "timestamp": now_iso})
-                today_record['events'] = events
-                self.save_attendance()
-                return True, f"Clocked {'IN' if next_type == 'in' else 'OUT'} for {employee_name} at {now_time}"
+                    try:
+                        last_dt = datetime.fromisoformat(last_event['timestamp'])
+                        diff = (now_dt - last_dt).total_seconds()
+                        if diff < 120:
+                            conn.rollback()
+                            wait_sec = int(120 - diff)
+                            return False, f"Please wait {wait_sec} seconds before next attendance event. Cooldown is 2 minutes between IN/OUT for the same person."
+                    except ValueError:
+                        pass
+                    next_type = 'out' if last_event['type'] == 'in' else 'in'
+                conn.execute(
+                    "INSERT INTO events (employee, date, type, time, timestamp) VALUES (?, ?, ?, ?, ?)",
+                    (employee_name, today, next_type, now_time, now_iso)
+                )
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return True, f"Clocked {'IN' if next_type == 'in' else 'OUT'} for {employee_name} at {now_time}"
         except Exception as e:
             return False, f"Error marking attendance: {str(e)}"
 
+# Size TensorFlow's thread pool before any op runs, so several workers don't oversubscribe the CPU
+if TF_INTRA_OP_THREADS > 0:
+    tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+
+# Build every model DeepFace uses at import so no request pays the cold start
+modeling.build_model(task="face_detector", model_name=DETECTOR_BACKEND)
+embedder = Embedder(MODEL_NAME, DETECTOR_BACKEND)
+app.logger.info("Face embeddings computed with %s", embedder.backend)
+spoof_model = modeling.build_model(task="spoofing", model_name=SPOOFING_MODEL)
+
 # Initialize the system
 attendance_system = AttendanceSystem()
+detection_cache = DetectionCache()
+liveness_cache = LivenessCache()
+if SERVER_CAMERA:
+    camera = Camera(SERVER_CAMERA)
+
+@app.before_request
+def refresh_employees():
+    """Pick up employees enrolled or removed by other worker processes"""
+    attendance_system.refresh_if_changed()
 
 @app.route('/')
 def index():
@@ -313,10 +940,8 @@ def add_employee():
         if not name or not image_data:
             return jsonify({"success": False, "message": "Name and image are required"})
         # Duplicate check (case-insensitive, trimmed)
-        name_clean = name.strip().lower()
-        for existing_name in attendance_system.employees.keys():
-            if existing_name.strip().lower() == name_clean:
-                return jsonify({"success": False, "message": "Employee with this name already exists."})
+        if name.strip().lower() in attendance_system.name_index:
+            return jsonify({"success": False, "message": "Employee with this name already exists."})
         success, message = attendance_system.add_employee(name, image_data)
         return jsonify({"success": success, "message": message})
     except Exception as e:
@@ -331,14 +956,10 @@ def add_employee_file():
         if not name or not file:
             return jsonify({"success": False, "message": "Name and file are required"})
         # Duplicate check (case-insensitive, trimmed)
-        name_clean = name.strip().lower()
-        for existing_name in attendance_system.employees.keys():
-            if existing_name.strip().lower() == name_clean:
-                return jsonify({"success": False, "message": "Employee with this name already exists."})
-        # Read file and convert to base64
-        image_bytes = file.read()
-        image_data = 'data:image/jpeg;base64,' + base64.b64encode(image_bytes).decode('utf-8')
-        success, message = attendance_system.add_employee(name, image_data)
+        if name.strip().lower() in attendance_system.name_index:
+            return jsonify({"success": False, "message": "Employee with this name already exists."})
+        # Raw file bytes go straight to the decoder, no base64 round trip
+        success, message = attendance_system.add_employee(name, file.read())
         return jsonify({"success": success, "message": message})
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {str(e)}"})
@@ -351,53 +972,82 @@ def remove_employee():
         name = data.get('name')
         if not name:
             return jsonify({"success": False, "message": "Employee name required"})
-        # Remove from employees dict
-        if name in attendance_system.employees:
-            # Remove image directory
-            emp_dir = os.path.join(DB_PATH, name.replace(" ", "_"))
-            if os.path.exists(emp_dir):
-                import shutil
-                shutil.rmtree(emp_dir)
-            del attendance_system.employees[name]
-            attendance_system.save_employees()
-            return jsonify({"success": True, "message": f"Removed employee {name}"})
-        else:
-            return jsonify({"success": False, "message": "Employee not found"})
+        success, message = attendance_system.remove_employee(name)
+        return jsonify({"success": success, "message": message})
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {str(e)}"})
 
+def recognition_response(image_data, client=None):
+    """Run one admission-controlled recognition and build the JSON reply"""
+    # Bounded concurrency: queue briefly for a slot, then shed load instead of piling up
+    if not recognize_sema.acquire(timeout=RECOGNITION_ADMISSION_TIMEOUT):
+        return jsonify({
+            "success": False,
+            "message": "Recognition busy, please retry",
+            "spoofing_detected": False
+        }), 429
+    try:
+        employee_name, message, is_real = attendance_system.recognize_face(image_data, client)
+    finally:
+        recognize_sema.release()
+    
+    if not is_real:
+        return jsonify({
+            "success": False,
+            "message": message,
+            "spoofing_detected": True
+        })
+    
+    if employee_name:
+        return jsonify({
+            "success": True, 
+            "employee": employee_name,
+            "message": message,
+            "spoofing_detected": False
+        })
+    else:
+        return jsonify({
+            "success": False,
+            "message": message,
+            "spoofing_detected": False
+        })
+
 @app.route('/recognize', methods=['POST'])
 def recognize():
     """Recognize face from camera with antispoofing"""
     try:
-        data = request.json
-        image_data = data.get('image')
+        image_data = request_image()
         
         if not image_data:
             return jsonify({"success": False, "message": "Image data required"})
         
-        employee_name, message, is_real = attendance_system.recognize_face(image_data)
-        
-        if not is_real:
-            return jsonify({
-                "success": False,
-                "message": message,
-                "spoofing_detected": True
-            })
+        return recognition_response(image_data, request.remote_addr)
+    
+    except Exception as e:
+        return jsonify({"success": False, "message": f"Error: {str(e)}"})
+
+@app.route('/video_feed')
+def video_feed():
+    """Stream the server camera as MJPEG for an <img> tag"""
+    if camera is None:
+        return jsonify({"success": False, "message": "Server camera not configured"}), 404
+    try:
+        camera.start()
+    except RuntimeError as e:
+        return jsonify({"success": False, "message": str(e)}), 503
+    return Response(camera.mjpeg(), mimetype='multipart/x-mixed-replace; boundary=frame')
+
+@app.route('/recognize_camera', methods=['POST'])
+def recognize_camera():
+    """Recognize the current server camera frame on demand"""
+    if camera is None:
+        return jsonify({"success": False, "message": "Server camera not configured"}), 404
+    try:
+        frame = camera.latest()
+        if frame is None:
+            return jsonify({"success": False, "message": "No camera frame available yet"})
         
-        if employee_name:
-            return jsonify({
-                "success": True, 
-                "employee": employee_name,
-                "message": message,
-                "spoofing_detected": False
-            })
-        else:
-            return jsonify({
-                "success": False,
-                "message": message,
-                "spoofing_detected": False
-            })
+        return recognition_response(frame, "server-camera")
     
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {str(e)}"})
@@ -425,29 +1075,36 @@ def get_employees():
 
 @app.route('/get_attendance')
 def get_attendance():
-    """Get attendance records"""
-    return jsonify(attendance_system.attendance)
+    """Get attendance records, limited to one day with ?date=YYYY-MM-DD or paged with ?limit=N&before=<cursor>"""
+    limit = request.args.get('limit', type=int)
+    if limit and limit > 0:
+        records, next_before = attendance_system.get_attendance_page(
+            min(limit, ATTENDANCE_PAGE_MAX), request.args.get('before', type=int)
+        )
+        response = jsonify(records)
+        if next_before is not None:
+            response.headers['X-Next-Before'] = str(next_before)
+        return response
+    return jsonify(attendance_system.get_attendance_records(request.args.get('date')))
+
+@app.route('/detect_cache_stats')
+def detect_cache_stats():
+    """Get hit-rate counters for the /detect frame cache"""
+    return jsonify(detection_cache.cache_stats())
 
 @app.route('/detect', methods=['POST'])
 def detect():
     """Detect faces and return bounding boxes and liveness (spoofing) status"""
     try:
-        data = request.json
-        image_data = data.get('image')
+        image_data = request_image()
         if not image_data:
             return jsonify({"success": False, "message": "Image data required"})
-        # Decode base64 image
-        image_bytes = base64.b64decode(image_data.split(',')[1])
-        image = Image.open(io.BytesIO(image_bytes))
-        temp_path = "temp_detect.jpg"
-        image.save(temp_path)
+        image = decode_image(image_data)
+        cached = detection_cache.get(request.remote_addr, image)
+        if cached is not None:
+            return jsonify({"success": True, "faces": cached})
         try:
-            faces = DeepFace.extract_faces(
-                img_path=temp_path,
-                detector_backend="opencv",
-                enforce_detection=False,
-                anti_spoofing=True
-            )
+            faces = detect_faces(image)
             results = []
             for face in faces:
                 # face can be dict or object
@@ -465,12 +1122,9 @@ def detect():
                         "h": area.get('h', 0),
                         "is_real": is_real
                     })
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
+            detection_cache.put(request.remote_addr, image, results)
             return jsonify({"success": True, "faces": results})
         except Exception as e:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
             return jsonify({"success": False, "message": f"Detection error: {str(e)}"})
     except Exception as e:
         return jsonify({"success": False, "message": f"Error: {str(e)}"})
@@ -0,0 +1,154 @@
+"""GhostFaceNet embeddings served by ONNX Runtime, with DeepFace's Keras model as fallback.
+
+Export the ONNX graph once (needs tf2onnx):
+
+    python embedder.py --export
+
+With GHOSTFACENET_TENSORRT=1, build the TensorRT engine once before serving:
+
+    python embedder.py --build-trt
+"""
+import logging
+import os
+import numpy as np
+# DeepFace sets this before its own TensorFlow import; importing TensorFlow first must not switch it to Keras 3
+os.environ.setdefault("TF_USE_LEGACY_KERAS", "1")
+import tensorflow as tf
+from deepface.modules import detection, modeling, preprocessing
+
+try:
+    import onnxruntime as ort
+except ImportError:
+    ort = None
+
+ONNX_MODEL_PATH = os.environ.get("GHOSTFACENET_ONNX", "ghostfacenet.onnx")
+ONNX_INPUT_NAME = "input"
+ONNX_PROVIDERS = ["CUDAExecutionProvider", "OpenVINOExecutionProvider", "CPUExecutionProvider"]
+# Building a TensorRT engine takes minutes, so it is opt-in and done offline by build_tensorrt();
+# served workers only load the cached engine
+USE_TENSORRT = os.environ.get("GHOSTFACENET_TENSORRT", "").lower() in ("1", "true", "yes")
+TENSORRT_CACHE_PATH = os.environ.get("GHOSTFACENET_TRT_CACHE", "trt_cache")
+TENSORRT_MAX_BATCH = 16  # Faces per forward pass the cached engine covers without a rebuild
+TENSORRT_OPTIONS = {
+    "trt_fp16_enable": True,
+    "trt_engine_cache_enable": True,
+    "trt_engine_cache_path": TENSORRT_CACHE_PATH,
+    "trt_profile_min_shapes": f"{ONNX_INPUT_NAME}:1x112x112x3",
+    "trt_profile_opt_shapes": f"{ONNX_INPUT_NAME}:1x112x112x3",
+    "trt_profile_max_shapes": f"{ONNX_INPUT_NAME}:{TENSORRT_MAX_BATCH}x112x112x3",
+}
+
+logger = logging.getLogger(__name__)
+
+
+def tensorrt_engine_cached(cache_path=TENSORRT_CACHE_PATH):
+    """True once build_tensorrt() has written an engine to the cache"""
+    return os.path.isdir(cache_path) and any(f.endswith(".engine") for f in os.listdir(cache_path))
+
+
+class Embedder:
+    def __init__(self, model_name, detector_backend, onnx_path=ONNX_MODEL_PATH, tensorrt=None):
+        self.model_name = model_name
+        self.detector_backend = detector_backend
+        self.client = modeling.build_model(task="facial_recognition", model_name=model_name)
+        self.session = None
+        if ort is not None and os.path.exists(onnx_path):
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            available = ort.get_available_providers()
+            providers = [p for p in ONNX_PROVIDERS if p in available]
+            if tensorrt is None:
+                tensorrt = USE_TENSORRT and tensorrt_engine_cached()
+                if USE_TENSORRT and not tensorrt:
+                    # Building here would outlast gunicorn's boot timeout, so serve without TensorRT
+                    logger.warning("No TensorRT engine in %s; run 'python embedder.py --build-trt' first",
+                                   TENSORRT_CACHE_PATH)
+            if tensorrt and "TensorrtExecutionProvider" in available:
+                providers.insert(0, ("TensorrtExecutionProvider", TENSORRT_OPTIONS))
+            self.session = ort.InferenceSession(onnx_path, sess_options=options, providers=providers)
+            self.input_name = self.session.get_inputs()[0].name
+        else:
+            # One graph for any batch size instead of an eager Keras call per request
+            height, width = self.client.input_shape
+            self.keras_forward = tf.function(
+                lambda batch: self.client.model(batch, training=False),
+                input_signature=[tf.TensorSpec((None, height, width, 3), tf.float32)]
+            )
+        self.warm_up()
+
+    def warm_up(self):
+        """Run one dummy face at the real input size so graph tracing and buffer allocation happen now"""
+        height, width = self.client.input_shape
+        self.forward(np.zeros((1, height, width, 3), dtype=np.float32))
+
+    @property
+    def backend(self):
+        return "onnxruntime" if self.session is not None else "keras"
+
+    def forward(self, batch):
+        """Embed a preprocessed (N, H, W, 3) float32 batch"""
+        if self.session is not None:
+            return self.session.run(None, {self.input_name: batch.astype(np.float32, copy=False)})[0]
+        return self.keras_forward(batch.astype(np.float32, copy=False)).numpy()
+
+    def preprocess(self, face):
+        """Turn an extract_faces crop (RGB, [0, 1]) into the model's (1, H, W, 3) BGR input"""
+        height, width = self.client.input_shape
+        # extract_faces hands back RGB; the model was trained on BGR
+        return preprocessing.resize_image(img=face[:, :, ::-1], target_size=(width, height))
+
+    def embed_faces(self, faces):
+        """Embed already extracted and aligned faces, all in one batched forward pass"""
+        if not faces:
+            return []
+        batch = np.concatenate([self.preprocess(face['face']) for face in faces])
+        return list(self.forward(batch))
+
+    def represent(self, image):
+        """Return one embedding per face in a BGR image, preprocessed like DeepFace.represent"""
+        faces = detection.extract_faces(
+            img_path=image,
+            detector_backend=self.detector_backend,
+            grayscale=False,
+            enforce_detection=False,
+            align=True
+        )
+        return self.embed_faces(faces)
+
+
+def export_onnx(model_name="GhostFaceNet", output_path=ONNX_MODEL_PATH, opset=17):
+    """Convert DeepFace's Keras model to an ONNX graph with a dynamic batch dimension"""
+    import tf2onnx  # export-time only dependency
+
+    client = modeling.build_model(task="facial_recognition", model_name=model_name)
+    height, width = client.input_shape
+    signature = (tf.TensorSpec((None, height, width, 3), tf.float32, name=ONNX_INPUT_NAME),)
+    tf2onnx.convert.from_keras(client.model, input_signature=signature, opset=opset, output_path=output_path)
+    return output_path
+
+
+def build_tensorrt(model_name="GhostFaceNet", onnx_path=ONNX_MODEL_PATH):
+    """Build the TensorRT engine for the exported ONNX graph and cache it, in this one process"""
+    if ort is None or "TensorrtExecutionProvider" not in ort.get_available_providers():
+        raise RuntimeError("onnxruntime with the TensorRT execution provider is not installed")
+    if not os.path.exists(onnx_path):
+        raise RuntimeError(f"{onnx_path} not found; run 'python embedder.py --export' first")
+    # Warming up the session is what makes ONNX Runtime build and save the engine
+    Embedder(model_name, "opencv", onnx_path, tensorrt=True)
+    return TENSORRT_CACHE_PATH
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--export', action='store_true', help="write the ONNX model and exit")
+    parser.add_argument('--build-trt', action='store_true', help="build and cache the TensorRT engine and exit")
+    parser.add_argument('--output', default=ONNX_MODEL_PATH, help="ONNX file written by --export and read by --build-trt")
+    args = parser.parse_args()
+    if args.export:
+        print(f"Wrote {export_onnx(output_path=args.output)}")
+    elif args.build_trt:
+        print(f"Cached TensorRT engine in {build_tensorrt(onnx_path=args.output)}")
+    else:
+        parser.print_help()
@@ -0,0 +1,35 @@
+"""Gunicorn settings for serving the attendance system.
+
+Run with:
+    gunicorn -c gunicorn_conf.py app:app
+"""
+import multiprocessing
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5001")
+
+# Every worker loads its own TensorFlow, PyTorch, GhostFaceNet and Fasnet (see preload_app),
+# so the default is one; raise WEB_CONCURRENCY only where memory allows a copy per worker.
+# DeepFace inference releases the GIL inside TensorFlow/PyTorch, so threads already overlap
+# inference. Give every recognition slot (RECOG_CONCURRENCY in app.py) a thread and keep two
+# spare for polling, 429 replies and /video_feed streams
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+if os.environ.get("SERVER_CAMERA"):
+    # Only one process can hold the capture device
+    workers = 1
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", int(os.environ.get("RECOG_CONCURRENCY", "2")) + 2))
+
+# Split the cores between workers so each TensorFlow/PyTorch pool doesn't spin up one
+# thread per core; read by app.py at import, before the models are built
+_threads_per_worker = str(max(1, multiprocessing.cpu_count() // workers))
+os.environ.setdefault("TF_INTRA_OP_THREADS", _threads_per_worker)
+os.environ.setdefault("OMP_NUM_THREADS", _threads_per_worker)
+
+# TensorFlow and PyTorch are not fork-safe once their runtimes are initialized, so each
+# worker imports the app (and builds its models) itself instead of inheriting them
+preload_app = False
+
+# Workers build and warm up their models at import, before they first check in, and gunicorn
+# counts that against the timeout. A TensorRT engine is built offline (embedder.py --build-trt)
+timeout = 120
@@ -110,32 +110,44 @@ async function startCamera() {
     }
 }
 
-function captureFrame() {
-    if (!video || !canvas || !ctx) return null;
-    if (video.videoWidth === 0 || video.videoHeight === 0) return null;
+// Frames are posted as raw JPEG multipart uploads: no base64 inflation or decoding on either side
+function captureFrame(quality = 0.8) {
+    if (!video || !canvas || !ctx) return Promise.resolve(null);
+    if (video.videoWidth === 0 || video.videoHeight === 0) return Promise.resolve(null);
     canvas.width = video.videoWidth;
     canvas.height = video.videoHeight;
     ctx.drawImage(video, 0, 0);
-    return canvas.toDataURL('image/jpeg', 0.8);
+    return new Promise(resolve => canvas.toBlob(resolve, 'image/jpeg', quality));
+}
+
+function frameForm(blob) {
+    const form = new FormData();
+    form.append('image', blob, 'frame.jpg');
+    return form;
 }
 
 // --- Recognition ---
 async function recognizeFace() {
     if (isProcessing) return;
-    const imageData = captureFrame();
+    isProcessing = true;
+    const imageData = await captureFrame();
     if (!imageData) {
+        isProcessing = false;
         showStatus('Please start camera first', 'error');
         return;
     }
-    isProcessing = true;
     showLoading(true);
     if (recognizeFaceBtn) recognizeFaceBtn.disabled = true;
     try {
         const response = await fetch('/recognize', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ image: imageData })
+            body: frameForm(imageData)
         });
+        if (response.status === 429) {
+            // Server is at its recognition limit; nothing was checked, so say nothing about the face
+            showStatus('⏳ Recognition busy, please try again', 'info');
+            return;
+        }
         const result = await response.json();
         if (result.spoofing_detected) {
             showStatus(`🚫 ${result.message}`, 'error');
@@ -187,11 +199,10 @@ function badge(type) {
 async function loadAttendance() {
     if (!attendanceLog) return;
     try {
-        const response = await fetch('/get_attendance');
-        const attendance = await response.json();
-        attendanceLog.innerHTML = '';
         const today = new Date().toISOString().split('T')[0];
-        const todayAttendance = attendance.filter(record => record.date === today);
+        const response = await fetch(`/get_attendance?date=${encodeURIComponent(today)}`);
+        const todayAttendance = await response.json();
+        attendanceLog.innerHTML = '';
         if (todayAttendance.length === 0) {
             attendanceLog.innerHTML = '<div class="attendance-table-row empty">No attendance records for today</div>';
         } else {
@@ -236,13 +247,10 @@ async function loadAttendance() {
 async function loadPastAttendance() {
     if (!pastAttendanceLog) return;
     try {
-        const response = await fetch('/get_attendance');
-        const attendance = await response.json();
-        let filtered = attendance;
         const selectedDate = pastDatePicker && pastDatePicker.value;
-        if (selectedDate) {
-            filtered = attendance.filter(record => record.date === selectedDate);
-        }
+        const url = selectedDate ? `/get_attendance?date=${encodeURIComponent(selectedDate)}` : '/get_attendance';
+        const response = await fetch(url);
+        const filtered = await response.json();
         if (filtered.length === 0) {
             pastAttendanceLog.innerHTML = '<div class="attendance-table-row empty">No attendance records found.</div>';
         } else {
@@ -284,15 +292,24 @@ async function loadPastAttendance() {
     }
 }
 
-async function loadAllPastAttendance() {
+const ALL_PAST_PAGE_SIZE = 500;
+
+async function loadAllPastAttendance(before = null) {
     if (!allPastAttendanceLog) return;
     try {
-        const response = await fetch('/get_attendance');
+        // Newest events first, one keyset page at a time; older pages load on demand
+        let url = `/get_attendance?limit=${ALL_PAST_PAGE_SIZE}`;
+        if (before) url += `&before=${encodeURIComponent(before)}`;
+        const response = await fetch(url);
         const attendance = await response.json();
-        if (attendance.length === 0) {
+        const nextBefore = response.headers.get('X-Next-Before');
+        const loadOlderBtn = document.getElementById('allPastLoadOlder');
+        if (loadOlderBtn) loadOlderBtn.remove();
+        if (!before) allPastAttendanceLog.innerHTML = '';
+        if (attendance.length === 0 && !before) {
             allPastAttendanceLog.innerHTML = '<div class="attendance-table-row empty">No attendance records found.</div>';
         } else {
-            let rowIdx = 0;
+            let rowIdx = allPastAttendanceLog.querySelectorAll('.attendance-table-row').length;
             attendance.forEach(record => {
                 if (record.events && Array.isArray(record.events)) {
                     record.events.forEach(ev => {
@@ -325,6 +342,14 @@ async function loadAllPastAttendance() {
                 }
             });
         }
+        if (nextBefore) {
+            const btn = document.createElement('button');
+            btn.id = 'allPastLoadOlder';
+            btn.className = 'tab-btn';
+            btn.textContent = 'Load older';
+            btn.addEventListener('click', () => loadAllPastAttendance(nextBefore));
+            allPastAttendanceLog.appendChild(btn);
+        }
     } catch (error) {
         allPastAttendanceLog.innerHTML = '<div class="attendance-table-row empty">Error loading all past attendance</div>';
     }
@@ -388,15 +413,12 @@ async function liveDetect() {
     if (isProcessing) return;
     if (detectionInFlight) return;
     detectionInFlight = true;
-    canvas.width = video.videoWidth;
-    canvas.height = video.videoHeight;
-    ctx.drawImage(video, 0, 0);
-    const imageData = canvas.toDataURL('image/jpeg', 0.7);
     try {
+        const imageData = await captureFrame(0.7);
+        if (!imageData) return;
         const response = await fetch('/detect', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ image: imageData })
+            body: frameForm(imageData)
         });
         const result = await response.json();
         if (result.success) {
@@ -441,16 +463,23 @@ function toggleRealtimeMode() {
 
 async function realtimeRecognize() {
     if (isProcessing || !realtimeMode) return;
-    const imageData = captureFrame();
-    if (!imageData) return;
     isProcessing = true;
+    const imageData = await captureFrame();
+    if (!imageData) {
+        isProcessing = false;
+        return;
+    }
     showLoading(true);
     try {
         const response = await fetch('/recognize', {
             method: 'POST',
-            headers: { 'Content-Type': 'application/json' },
-            body: JSON.stringify({ image: imageData })
+            body: frameForm(imageData)
         });
+        if (response.status === 429) {
+            // Server is at its recognition limit; the next interval tick retries
+            showStatus('⏳ Recognition busy, retrying…', 'info');
+            return;
+        }
         const result = await response.json();
         if (result.spoofing_detected) {
             showStatus(`🚫 ${result.message}`, 'error');